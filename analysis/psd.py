@@ -1,9 +1,50 @@
 import os
+import sys
+import contextlib
 import numpy as np
 import pandas as pd
 import argparse
+import scipy.fft
 from scipy.signal import spectrogram, get_window
+
+# When run as a batch script there is no need for a GUI event loop: default
+# to the Agg rasterizer (plt.show() becomes a no-op) unless the user picked
+# a backend themselves via MPLBACKEND or is in an interactive session.
+import matplotlib
+if __name__ == "__main__" and not sys.flags.interactive and "MPLBACKEND" not in os.environ:
+    matplotlib.use("Agg")
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+
+# Optional: route scipy's FFTs through pyFFTW with cached plans, so repeated
+# spectrogram calls (e.g. batch runs of `calculate_psd`) reuse their FFT plans.
+# Falls back silently to the default pocketfft backend when unavailable.
+try:
+    import pyfftw
+    pyfftw.interfaces.cache.enable()
+    pyfftw.interfaces.cache.set_keepalive_time(60)
+    _FFT_BACKEND = pyfftw.interfaces.scipy_fft
+except ImportError:
+    _FFT_BACKEND = None
+
+# Optional: pandas' multithreaded pyarrow CSV engine, when installed
+try:
+    import pyarrow  # noqa: F401
+    _CSV_ENGINE = {'engine': 'pyarrow'}
+except ImportError:
+    _CSV_ENGINE = {}
+
+# Optional: numba JIT for the band-power reduction (see _bandpower_reduce)
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+def _fft_backend():
+    if _FFT_BACKEND is None:
+        return contextlib.nullcontext()
+    return scipy.fft.set_backend(_FFT_BACKEND)
 
 # ========== CONFIG ==========
 
@@ -32,53 +73,54 @@ SAMPLE_RATE = 256
 WINDOW_SIZE = 256
 SLIDE_RATE = 22
 
+# Shared read-only STFT window; no need to recompute it per call
+_HAMMING_WIN = get_window('hamming', WINDOW_SIZE)
+
 
 # ========== PSD Computation ==========
 
-def compute_muse_psd(df:pd.DataFrame):
+def compute_muse_psd(df:pd.DataFrame, return_linear:bool=False):
 
-    # Get the hamming window class with the defined window size
-    win = get_window('hamming', WINDOW_SIZE)
-    
-    # Intiialize outputs
-    psd = {}
-    freqs = None
-    times = None
-    
-    # For each channel, we:
-    for ch in CHANNELS:
-        # use `spectrogram` helper to calculate properties of the raw EEG signal in that channel
-        f, t, Sxx = spectrogram(
-            df[ch].values,
+    # Stack all channels into a (n_channels, n_samples) array so a single
+    # `spectrogram` call batches the FFT across channels instead of
+    # re-running the STFT setup once per channel.
+    x = df[CHANNELS].to_numpy().T
+
+    # `Sxx` has shape (n_channels, n_freqs, n_times)
+    with _fft_backend():
+        freqs, t, Sxx = spectrogram(
+            x,
             fs = SAMPLE_RATE,
-            window = win,
+            window = _HAMMING_WIN,
             nperseg = WINDOW_SIZE,
             noverlap = WINDOW_SIZE - SLIDE_RATE,
             scaling = 'density',
-            mode = 'psd'
+            mode = 'psd',
+            axis = -1
         )
-        # Convert to decibels (dB)
-        Sxx_dB = 10 * np.log10(Sxx + 1e-12)
-
-        # Add our responses to out outputs. We only do this once.
-        psd[ch] = Sxx_dB
-        if freqs is None:
-            # Add freqs first
-            freqs = f
-
-            # Because times `t` is relative to start, we need to map back to original timestamps
-            # Convert spectrogram times (seconds since start)
-            # to sample indices in original dataframe
-            sample_idx = np.round(t * SAMPLE_RATE).astype(int)
-            sample_idx = np.clip(sample_idx, 0, len(df) - 1)
-
-            # Pull original timestamps
-            times = pd.DataFrame({
-                "unix_ms": df.loc[sample_idx, "unix_ms"].values,
-                "lsl_unix_ts": df.loc[sample_idx, "lsl_unix_ts"].values
-            })
-    
-    # Return the three data extracted from all eeg channels
+
+    # Convert to decibels (dB) once for the whole stack
+    Sxx_dB = 10 * np.log10(Sxx + 1e-12)
+    psd = {ch: Sxx_dB[i] for i, ch in enumerate(CHANNELS)}
+
+    # Because times `t` is relative to start, we need to map back to original timestamps
+    # Convert spectrogram times (seconds since start)
+    # to sample indices in original dataframe
+    sample_idx = np.round(t * SAMPLE_RATE).astype(int)
+    sample_idx = np.clip(sample_idx, 0, len(df) - 1)
+
+    # Pull original timestamps
+    times = pd.DataFrame({
+        "unix_ms": df.loc[sample_idx, "unix_ms"].values,
+        "lsl_unix_ts": df.loc[sample_idx, "lsl_unix_ts"].values
+    })
+
+    # Return the three data extracted from all eeg channels. Callers that go
+    # on to compute bandpowers can ask for the linear-scale spectra too,
+    # saving them an exp() pass to undo the dB conversion.
+    if return_linear:
+        psd_linear = {ch: Sxx[i] for i, ch in enumerate(CHANNELS)}
+        return freqs, times, psd, psd_linear
     return freqs, times, psd
 
 # ========== PSD PLOTTING ==========
@@ -99,8 +141,10 @@ def plot_muse_psd(
     n_rows = len(psds)
     n_cols = len(CHANNELS)
 
-    # Define the subplot grid
-    fig, axes = plt.subplots( n_rows, n_cols, figsize=(width/dpi, height/dpi), dpi=dpi, constrained_layout=True)
+    # Define the subplot grid. Constrained layout is switched on only once
+    # all cells are populated, so the solver runs a single time instead of
+    # after every artist insertion.
+    fig, axes = plt.subplots( n_rows, n_cols, figsize=(width/dpi, height/dpi), dpi=dpi, constrained_layout=False)
 
     # Make the axis iterable
     if n_rows == 1 and n_cols == 1: axes = np.array([[axes]])
@@ -118,6 +162,16 @@ def plot_muse_psd(
             ax = axes[row_index][col_index]
             data = psd[ch]
 
+            # Block-mean the time axis down to roughly the rendered pixel
+            # width — anything finer collapses into the same display pixel
+            # but still costs colormapping and PNG encode time.
+            target_w = max(1, int(width / n_cols))
+            n_frames = data.shape[1]
+            block = max(1, n_frames // target_w)
+            if block > 1:
+                trimmed = (n_frames // block) * block
+                data = data[:, :trimmed].reshape(data.shape[0], trimmed // block, block).mean(-1)
+
             im = ax.imshow(
                 data,
                 aspect='auto',
@@ -130,8 +184,11 @@ def plot_muse_psd(
             ax.set_xlabel("Time (s)")
             ax.set_ylabel("Freq (Hz)")
 
-    # Add colorbar
-    cbar = fig.colorbar(im, shrink=0.95)
+    # One layout solve for the fully-built grid
+    fig.set_layout_engine('constrained')
+
+    # Add colorbar, anchored to the whole grid
+    cbar = fig.colorbar(im, ax=axes.ravel().tolist(), shrink=0.95)
     cbar.set_label("Power (dB)")
 
     # Add global title
@@ -147,38 +204,88 @@ def plot_muse_psd(
 
 # ========== TIME SERIES BANDPOWERS ==========
 
-def compute_bandpowers_time_series(
-        freqs, 
-        times, 
-        psd, ):
-    
-    records = []
-    for ch, Sxx_dB in psd.items():
-        # Convert back from dB to linear scale
-        Sxx_linear = 10 ** (Sxx_dB / 10)
-
-        for band, (fmin, fmax) in BANDS.items():
-            idx = np.where((freqs >= fmin) & (freqs <= fmax))[0]
-
-            if len(idx) == 0:
-                continue
-
-            # Sum across frequency bins, keep per-time-frame values
-            band_power = np.sum(Sxx_linear[idx, :], axis=0)
-
-            # Logarithm → absolute band power
-            band_power_log = np.log10(band_power + 1e-12)
+_BAND_SELECTOR_CACHE = {}
+
+def _band_selector(freqs):
+    # The frequency grid is fixed by (SAMPLE_RATE, WINDOW_SIZE), so the
+    # selector matrix is identical on every call; build it once per grid.
+    key = (len(freqs), float(freqs[0]), float(freqs[-1]))
+    cached = _BAND_SELECTOR_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    # Selector matrix: one row of frequency-bin weights per band, so the
+    # per-band sum becomes a single matrix product instead of nested loops.
+    band_names = list(BANDS.keys())
+    sel = np.zeros((len(band_names), len(freqs)))
+    for bi, (fmin, fmax) in enumerate(BANDS.values()):
+        sel[bi, (freqs >= fmin) & (freqs <= fmax)] = 1.0
+
+    # Drop bands with no frequency bins
+    keep = sel.any(axis=1)
+    sel = sel[keep]
+    band_names = [band for band, kept in zip(band_names, keep) if kept]
+
+    # Bands are contiguous index ranges on the monotonic frequency grid, so
+    # also keep the [lo, hi] bin bounds for the JIT kernel.
+    band_lo = np.array([np.flatnonzero(row)[0] for row in sel], dtype=np.int64)
+    band_hi = np.array([np.flatnonzero(row)[-1] for row in sel], dtype=np.int64)
+
+    _BAND_SELECTOR_CACHE[key] = (sel, band_names, band_lo, band_hi)
+    return sel, band_names, band_lo, band_hi
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _bandpower_reduce(Sxx_linear, band_lo, band_hi, out):
+        # Fused sum + log10 over contiguous frequency-bin ranges, parallel
+        # across channels.
+        n_ch, _, n_times = Sxx_linear.shape
+        n_bands = band_lo.shape[0]
+        for c in prange(n_ch):
+            for b in range(n_bands):
+                for t in range(n_times):
+                    acc = 0.0
+                    for f in range(band_lo[b], band_hi[b] + 1):
+                        acc += Sxx_linear[c, f, t]
+                    out[c, b, t] = np.log10(acc + 1e-12)
+else:
+    _bandpower_reduce = None
 
-            for i, val in enumerate(band_power_log):
-                records.append([
-                    times.iloc[i]["unix_ms"],
-                    times.iloc[i]["lsl_unix_ts"],
-                    ch,
-                    band,
-                    val
-                ])
-
-    bandpowers = pd.DataFrame(records, columns=["unix_ms", "lsl_unix_ts", "channel", "band", "power"])
+def compute_bandpowers_time_series(
+        freqs,
+        times,
+        psd,
+        psd_linear = None, ):
+
+    # One row of frequency-bin weights per band (cached across calls)
+    sel, band_names, band_lo, band_hi = _band_selector(freqs)
+
+    # Stack channels to (C, F, T) linear power, reduce to (C, B, T) in one
+    # pass. Prefer the linear spectra when the caller provides them, which
+    # skips undoing the dB conversion with a full exp() pass.
+    if psd_linear is not None:
+        Sxx_linear = np.stack([psd_linear[ch] for ch in CHANNELS])
+    else:
+        Sxx_linear = 10 ** (np.stack([psd[ch] for ch in CHANNELS]) / 10)
+    # Reduce with the JIT kernel when numba is around (fused sum + log10,
+    # threaded over channels); otherwise a single einsum + log10 pass.
+    if _bandpower_reduce is not None:
+        band_power_log = np.empty((Sxx_linear.shape[0], len(band_names), Sxx_linear.shape[2]))
+        _bandpower_reduce(np.ascontiguousarray(Sxx_linear), band_lo, band_hi, band_power_log)
+    else:
+        band_power = np.einsum('bf,cft->cbt', sel, Sxx_linear)
+        # Logarithm → absolute band power
+        band_power_log = np.log10(band_power + 1e-12)
+
+    # Flatten in channel → band → time order (same row order as the old loop)
+    n_ch, n_bands, n_times = band_power_log.shape
+    bandpowers = pd.DataFrame({
+        "unix_ms":      np.tile(times["unix_ms"].to_numpy(), n_ch * n_bands),
+        "lsl_unix_ts":  np.tile(times["lsl_unix_ts"].to_numpy(), n_ch * n_bands),
+        "channel":      pd.Categorical(np.repeat(CHANNELS, n_bands * n_times)),
+        "band":         pd.Categorical(np.tile(np.repeat(band_names, n_times), n_ch)),
+        "power":        band_power_log.ravel()
+    })
     return bandpowers
 
 # ========== PLOT TIME SERIES ==========
@@ -220,23 +327,47 @@ def plot_time_series(
     elif nrows == 1:                axes = np.array([axes])
     elif ncols == 1:                axes = np.array([[ax] for ax in axes])
 
+    # Pull the plotting columns out once; each facet cell is then a boolean
+    # mask over these arrays instead of a full DataFrame copy.
+    x_all = df[x_col].to_numpy()
+    y_all = df[y_col].to_numpy()
+    g_all = df[c_col].to_numpy()
+    groups = np.unique(g_all)
+    row_all = df[facet_row].to_numpy() if facet_row else None
+    col_all = df[facet_col].to_numpy() if facet_col else None
+
+    # Resolve one color per group up front (fall back to the default cycle)
+    cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    group_colors = {
+        group: color_dict[group] if color_dict and group in color_dict else cycle[k % len(cycle)]
+        for k, group in enumerate(groups)
+    }
+
     # Plotting
     for i, r_val in enumerate(facet_row_values):
         for j, c_val in enumerate(facet_col_values):
-            
+
             # Create a reference to the current axis
             ax = axes[i, j]
 
-            # Get a subset of your DF
-            subset = df.copy()
-            if facet_row:   subset = subset[subset[facet_row] == r_val]
-            if facet_col:   subset = subset[subset[facet_col] == c_val]
+            # Mask down to this facet cell
+            cell_mask = np.ones(len(df), dtype=bool)
+            if facet_row:   cell_mask &= (row_all == r_val)
+            if facet_col:   cell_mask &= (col_all == c_val)
+
+            # Gather one line segment per group and add them all as a single
+            # LineCollection artist rather than one ax.plot call per group
+            segments = []
+            colors = []
+            for group in groups:
+                group_mask = cell_mask & (g_all == group)
+                if not group_mask.any():
+                    continue
+                segments.append(np.column_stack([x_all[group_mask], y_all[group_mask]]))
+                colors.append(group_colors[group])
+            ax.add_collection(LineCollection(segments, colors=colors))
+            ax.autoscale()
 
-            # Plot the groups based on color
-            for group, gdf in subset.groupby(c_col):
-                color = color_dict[group] if color_dict and group in color_dict else None
-                ax.plot(gdf[x_col], gdf[y_col], label=str(group), color=color)
-            
             # Facet Titles
             title_parts = []
             if facet_row: title_parts.append(f"{facet_row} = {r_val}")
@@ -245,8 +376,10 @@ def plot_time_series(
             if i == nrows - 1:  ax.set_xlabel(x_label)
             if j == 0:          ax.set_ylabel(y_label)
 
-            # Legend
-            if i == 0 and j == 0:   ax.legend()
+            # Legend (proxy handles, since LineCollection lines carry no labels)
+            if i == 0 and j == 0:
+                handles = [Line2D([0], [0], color=group_colors[group], label=str(group)) for group in groups]
+                ax.legend(handles=handles)
     
     # Global plot qualities
     if title is not None:
@@ -264,7 +397,7 @@ def plot_time_series(
 
 def calculate_psd(src):
     # Read the pandas dataframe
-    df = pd.read_csv(src)
+    df = pd.read_csv(src, **_CSV_ENGINE)
 
     # Generate output directory, which save everything to a `plots` directory in the same directory as the provided file
     csv_output_dir = os.path.dirname(src)
@@ -272,12 +405,12 @@ def calculate_psd(src):
     os.makedirs(plot_output_dir, exist_ok=True)
 
     # Compute and plot freqs, times, and psd
-    freqs, times, psd = compute_muse_psd(df)
+    freqs, times, psd, psd_linear = compute_muse_psd(df, return_linear=True)
     psd_outpath = os.path.join(plot_output_dir,'psd.png')
     plot_muse_psd([{'freqs':freqs, 'times':times, 'psd':psd}], savename=psd_outpath)
 
     # Compute and plot time series
-    bandpowers = compute_bandpowers_time_series(freqs, times, psd)
+    bandpowers = compute_bandpowers_time_series(freqs, times, psd, psd_linear=psd_linear)
     bandpowers_outpath = os.path.join(plot_output_dir,'bandpowers.png')
     plot_time_series(
         bandpowers, 
@@ -1,29 +1,97 @@
 import os
+import sys
 import glob
 import argparse
 import numpy as np
 import pandas as pd
+
+# When run as a batch script there is no need for a GUI event loop: default
+# to the Agg rasterizer (plt.show() becomes a no-op) unless the user picked
+# a backend themselves via MPLBACKEND or is in an interactive session.
+import matplotlib
+if __name__ == "__main__" and not sys.flags.interactive and "MPLBACKEND" not in os.environ:
+    matplotlib.use("Agg")
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import math
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Optional: pandas' multithreaded pyarrow CSV engine, when installed
+try:
+    import pyarrow  # noqa: F401
+    _CSV_ENGINE = {'engine': 'pyarrow'}
+except ImportError:
+    _CSV_ENGINE = {}
 
 FILES = ['EEG.csv', 'Accelerometer.csv', 'Gyroscope.csv']
 TIMESTAMP_COLUMNS = ['TimeStamp', 'unix_ms', 'unix_ts', 'lsl_unix_ts']
 EXCLUSIONS = ['BANDPOWERS.csv', 'mind_monitor.csv']
 
+# Files above this size are streamed in chunks rather than read in one shot
+CHUNKED_READ_BYTES = 50 * 1024 * 1024
+CHUNKSIZE = 200_000
+
 
 # ============ DUPLICATE IDENTIFICATION ============
 
 def get_consecutive_duplicates(df:pd.DataFrame, columns):
-    change_mask = df[columns].ne(df[columns].shift()).any(axis=1)
-    group_ids = change_mask.cumsum()
-    df2 = df.assign(
-        consecutive_count = df.groupby(group_ids).cumcount() + 1,
-        count = df.groupby(group_ids)[columns[0]].transform('size')
-    )
-    dist = df2['count'].value_counts().sort_index()
+    # Run-length encode the rows in numpy: find where any column changes,
+    # then the gaps between change points are the consecutive-run lengths.
+    arr = df[columns].to_numpy()
+    if len(arr) == 0:
+        return pd.Series(dtype='int64')
+    change = np.any(arr[1:] != arr[:-1], axis=1)
+    idx = np.concatenate(([0], np.flatnonzero(change) + 1, [len(arr)]))
+    run_len = np.diff(idx)
+    # Weighting by run length counts *rows* per run length, matching the old
+    # groupby/transform('size') + value_counts distribution.
+    counts = np.bincount(run_len, weights=run_len).astype('int64')
+    lengths = np.flatnonzero(counts)
+    dist = pd.Series(counts[lengths], index=lengths)
     return dist
 
 
+class RunLengthAccumulator:
+    """Accumulates the consecutive-duplicate distribution across row chunks,
+    merging runs that straddle chunk boundaries."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.counts = Counter()
+        self._prev_row = None
+        self._carry = 0
+
+    def update(self, chunk:pd.DataFrame):
+        arr = chunk[self.columns].to_numpy()
+        if len(arr) == 0:
+            return
+        change = np.any(arr[1:] != arr[:-1], axis=1)
+        idx = np.concatenate(([0], np.flatnonzero(change) + 1, [len(arr)]))
+        run_len = np.diff(idx)
+        # If the chunk opens with the same row the previous chunk ended on,
+        # its first run continues the carried one; otherwise flush the carry.
+        if self._prev_row is not None:
+            if not np.any(arr[0] != self._prev_row):
+                run_len[0] += self._carry
+            elif self._carry:
+                self.counts[self._carry] += self._carry
+        # All runs except the last are complete (row-weighted, as above)
+        for length, n in zip(*np.unique(run_len[:-1], return_counts=True)):
+            self.counts[int(length)] += int(length) * int(n)
+        self._carry = int(run_len[-1])
+        self._prev_row = arr[-1]
+
+    def finalize(self):
+        if self._carry:
+            self.counts[self._carry] += self._carry
+            self._carry = 0
+        if not self.counts:
+            return pd.Series(dtype='int64')
+        lengths = sorted(self.counts)
+        return pd.Series([self.counts[length] for length in lengths], index=lengths)
+
+
 # =========== PLOTTING ============
 
 def plot_raw(filename:str, df:pd.DataFrame, ts_col:str, with_lines:bool=False, outpath:str=None):
@@ -38,8 +106,11 @@ def plot_raw(filename:str, df:pd.DataFrame, ts_col:str, with_lines:bool=False, o
         print(f"Skipping {filename}: No data channels found.")
         return
 
-    # Create a figure with one subplot per channel
-    fig, axes = plt.subplots(nrows=num_channels, ncols=1, figsize=(12, 3 * num_channels), sharex=True)
+    # Create a figure with one subplot per channel. The OO Figure API keeps
+    # this free of pyplot's global figure state, so workers can plot from
+    # threads safely.
+    fig = Figure(figsize=(12, 3 * num_channels))
+    axes = fig.subplots(nrows=num_channels, ncols=1, sharex=True)
     n_ticks = 5
 
     # If there's only one channel, axes is not a list, so we wrap it
@@ -48,10 +119,16 @@ def plot_raw(filename:str, df:pd.DataFrame, ts_col:str, with_lines:bool=False, o
         
     # Use timestamp for the X-axis (relative to the start of the recording)
     #time_x = df[ts_col] - df[ts_col].iloc[0]
+    # Decimate the scatter to ~5k markers per channel — a plot can't display
+    # more anyway, and matplotlib pays per marker for both render time and
+    # PNG size. The optional line overlay still draws the full series.
+    x_full = df[ts_col].to_numpy()
+    step = max(1, len(df) // 5000)
     for i, col in enumerate(data_cols):
-        axes[i].scatter(df[ts_col], df[col], label=col, color='tab:blue', s=0.5)
+        y_full = df[col].to_numpy()
+        axes[i].scatter(x_full[::step], y_full[::step], label=col, color='tab:blue', s=0.5, rasterized=True)
         if with_lines:
-            axes[i].plot(df[ts_col], df[col], label=col, color='tab:blue', alpha=0.25, linewidth=1)
+            axes[i].plot(x_full, y_full, label=col, color='tab:blue', alpha=0.25, linewidth=1)
         axes[i].set_ylabel(col)
         xmin, xmax = axes[i].get_xlim()
         axes[i].set_xticks(np.linspace(xmin, xmax, n_ticks))
@@ -60,15 +137,54 @@ def plot_raw(filename:str, df:pd.DataFrame, ts_col:str, with_lines:bool=False, o
     # Additional plotting details such as title and x-axis labels
     axes[-1].set_xlabel("Time")
     fig.suptitle(f"Signal Performance: {stream_name} Recording", fontsize=16)
-    plt.tight_layout(rect=[0, 0.03, 1, 0.95])
+    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
 
     # Save to a PNG file
     if outpath is not None:
-        plt.savefig(outpath, bbox_inches='tight')
-    plt.close(fig)
+        fig.savefig(outpath, bbox_inches='tight')
     print(f"Generated {stream_name} from {filename}")
 
 
+# ============ PER-FILE WORK ============
+
+def _process_file(file_path:str, out_dir:str, ts_col:str, with_lines:bool=False):
+    filename = os.path.basename(file_path)
+    stream_name = os.path.splitext(filename)[0]
+
+    if os.path.getsize(file_path) < CHUNKED_READ_BYTES:
+        # Small file: read in one shot
+        df = pd.read_csv(file_path, **_CSV_ENGINE)
+        df_cols = [col for col in df.columns if col not in TIMESTAMP_COLUMNS]
+        dupes1 = get_consecutive_duplicates(df, [ts_col])
+        dupes2 = get_consecutive_duplicates(df, [ts_col, *df_cols])
+    else:
+        # Large file: stream in chunks so peak memory stays at ~CHUNKSIZE
+        # rows. The duplicate distributions accumulate chunk-by-chunk, and a
+        # decimated preview is kept for the raw plot (which decimates again
+        # to ~5k points anyway).
+        acc_ts, acc_all, preview = None, None, []
+        for chunk in pd.read_csv(file_path, chunksize=CHUNKSIZE):
+            if acc_ts is None:
+                df_cols = [col for col in chunk.columns if col not in TIMESTAMP_COLUMNS]
+                acc_ts = RunLengthAccumulator([ts_col])
+                acc_all = RunLengthAccumulator([ts_col, *df_cols])
+            acc_ts.update(chunk)
+            acc_all.update(chunk)
+            preview.append(chunk.iloc[::max(1, len(chunk) // 2000)])
+        dupes1 = acc_ts.finalize()
+        dupes2 = acc_all.finalize()
+        df = pd.concat(preview, ignore_index=True)
+
+    # Plot raw data
+    raw_plot_outpath = os.path.join(out_dir, f"{stream_name}.png")
+    plot_raw(filename, df, ts_col, with_lines=with_lines, outpath=raw_plot_outpath)
+
+    # Collate duplicates
+    dupes = pd.concat([dupes1, dupes2], axis=1).fillna(0)
+    dupes.columns = [f"TS ({ts_col})", 'TS & Columns']
+    return stream_name, dupes
+
+
 # ============ MAIN ============
 
 def validate(src_dir:str, ts_col:str, with_lines:bool=False, show:bool=False):
@@ -92,32 +208,25 @@ def validate(src_dir:str, ts_col:str, with_lines:bool=False, show:bool=False):
     out_dir = os.path.join(src_dir, 'plots')
     os.makedirs(out_dir, exist_ok=True)
 
+    # Process files in parallel: reads, raw plots and duplicate detection are
+    # independent per file, and both pandas I/O and Agg rasterization release
+    # the GIL.
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = list(executor.map(
+            lambda file_path: _process_file(file_path, out_dir, ts_col, with_lines=with_lines),
+            files
+        ))
+
     # Create a super figure
     ncols = 3
     nrows = math.ceil(len(files)/ncols)
     fig = plt.figure(figsize=(nrows*4, ncols*2), layout=None)
     gs = fig.add_gridspec(nrows, ncols, hspace=0.3, wspace=0.15, top=0.9)
 
-    # Iterate through all files
-    for i, file_path in enumerate(files):
+    # Plot duplicates, sequentially on the main thread
+    for i, (stream_name, dupes) in enumerate(results):
         col_index = i % ncols
         row_index = math.floor(i/ncols)
-        filename = os.path.basename(file_path)
-        stream_name = os.path.splitext(filename)[0]
-
-        # Read and plot raw data
-        df = pd.read_csv(file_path)
-        df_cols = [col for col in df.columns if col not in TIMESTAMP_COLUMNS]
-        raw_plot_outpath = os.path.join(out_dir, f"{stream_name}.png")
-        plot_raw(filename, df, ts_col, with_lines=with_lines, outpath=raw_plot_outpath)
-
-        # Identify duplicates
-        dupes1 = get_consecutive_duplicates(df, [ts_col])
-        dupes2 = get_consecutive_duplicates(df, [ts_col, *df_cols])
-        dupes = pd.concat([dupes1, dupes2], axis=1).fillna(0)
-        dupes.columns = [f"TS ({ts_col})", 'TS & Columns']
-        
-        # Plot duplicates
         ax = fig.add_subplot(gs[row_index, col_index])
         dupes.plot.bar(ax=ax, width=0.8, edgecolor='black')
         ax.set_title(stream_name)
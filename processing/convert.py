@@ -4,6 +4,14 @@ import argparse
 import pandas as pd
 import datetime
 
+# Optional: pyarrow's CSV writer is multithreaded C++ and considerably faster
+# than the pandas writer on large recordings. Fall back to pandas without it.
+try:
+    import pyarrow
+    import pyarrow.csv
+except ImportError:
+    pyarrow = None
+
 _DESCRIPTION = "Convert raw muse data from Mind Monitor into BlueMuse format"
 
 _MUSE_REMAPPINGS = { 'RAW_TP9':'TP9', 
@@ -31,17 +39,37 @@ _MUSE_SAMPLE_RATES = {
     'IMU':52
 }
 
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+def timestamps_to_unix_nanoseconds(timestamps) -> np.ndarray:   # Helper: converts a whole timestamp column to unix, in one vectorized parse
+    parsed = pd.to_datetime(timestamps, format=_TIMESTAMP_FORMAT, cache=True)
+    return parsed.astype('datetime64[ns]').astype('int64').to_numpy()
+
 def timestamp_to_unix_milliseconds(x) -> int:      # Helper: converts timestamps to unix
-    date_format = datetime.datetime.strptime(x, "%Y-%m-%d %H:%M:%S.%f")
+    date_format = datetime.datetime.strptime(x, _TIMESTAMP_FORMAT)
     unix_seconds = datetime.datetime.timestamp(date_format)
     unix_milliseconds = int(unix_seconds * 1000)
     return unix_milliseconds
 
 def timestamp_to_unix_seconds(x) -> int:      # Helper: converts timestamps to unix
-    date_format = datetime.datetime.strptime(x, "%Y-%m-%d %H:%M:%S.%f")
+    date_format = datetime.datetime.strptime(x, _TIMESTAMP_FORMAT)
     unix_seconds = datetime.datetime.timestamp(date_format)
     return unix_seconds
 
+def read_raw_csv(path:str) -> pd.DataFrame:    # Helper: read a Mind Monitor CSV with the fastest available parser
+    if pyarrow is not None:
+        try:
+            return pd.read_csv(path, dtype={'Elements':'category'}, engine='pyarrow')
+        except (ValueError, TypeError):     # pyarrow engine rejects some option combos; fall through
+            pass
+    return pd.read_csv(path, dtype={'Elements':'category'})
+
+def write_csv(df:pd.DataFrame, path:str):   # Helper: fastest available CSV writer
+    if pyarrow is not None:
+        pyarrow.csv.write_csv(pyarrow.Table.from_pandas(df, preserve_index=False), path)
+    else:
+        df.to_csv(path, index=False)
+
 def sample_synthetic_timestamps(n_samples:int, sfreq:int, start_unix_ms):
     dt_ms = 1000.0 / sfreq
     timestamps = (start_unix_ms + np.arange(n_samples) * dt_ms)
@@ -66,10 +94,12 @@ def estimate_sample_rate_duration(df, timestamp_col="unix_ms", is_milli:bool=Tru
 
 # Straightforward. Only thing is to set a `unix_ms` based on the timestamps
 def extract_blinks(df:pd.DataFrame):
-    blinks = df[df['Elements'] == '/muse/elements/blink']                           # Only rows with blink in the `Elements`` col.
-    blinks['unix_ms'] = blinks['TimeStamp'].apply(timestamp_to_unix_milliseconds)   # Blink timestamps set to `TimeStamp`
-    blinks['lsl_unix_ts'] = blinks['TimeStamp'].apply(timestamp_to_unix_seconds)    # LSL timestamps based on `TimeStamp` too
-    return blinks                                                                   # Return blinks
+    mask = (df['Elements'] == '/muse/elements/blink').to_numpy()    # Only rows with blink in the `Elements` col.
+    blinks = df.loc[mask].copy()                                    # Explicit copy avoids chained-assignment warnings
+    ns = timestamps_to_unix_nanoseconds(blinks['TimeStamp'])        # Parse each timestamp once, reuse for both columns
+    blinks['unix_ms'] = ns // 1_000_000                             # Blink timestamps set to `TimeStamp`
+    blinks['lsl_unix_ts'] = (ns // 1_000) / 1e6                     # LSL timestamps based on `TimeStamp` too
+    return blinks                                                   # Return blinks
 
 def extract_feature(df:pd.DataFrame, columns, sample_rate, start_unix_ms):
     raw = df[columns]
@@ -79,8 +109,8 @@ def extract_feature(df:pd.DataFrame, columns, sample_rate, start_unix_ms):
     return deduped
 
 def read_mm_file(src:str):
-    df = pd.read_csv(src)                                               # Read as a dataframe
-    signals = df[df['Elements'].isna()]                                 # Get the signals first
+    df = read_raw_csv(src)                                              # Read as a dataframe; categorical `Elements` avoids an object-dtype column
+    signals = df[df['Elements'].isna().to_numpy()]                      # Get the signals first
     start_ms = timestamp_to_unix_milliseconds(signals.iloc[0]['TimeStamp'])  # get the first signal row as the first timestamp
     df = df.rename(columns=_MUSE_REMAPPINGS)                            # Rename the columns
     return df, start_ms
@@ -132,24 +162,30 @@ def mm_to_bluemuse(target_filepath:str, output_dir:str="converted", groupby_choi
     return output_dir, eeg_outpath, accel_outpath, gyro_outpath, blinks_outpath
     """
 
-    df = pd.read_csv(target_filepath, dtype={'Elements':str})
-    df['unix_ms'] = df['TimeStamp'].apply(timestamp_to_unix_milliseconds)
-    df['lsl_unix_ts'] = df['TimeStamp'].apply(timestamp_to_unix_seconds)
+    df = read_raw_csv(target_filepath)
+    ns = timestamps_to_unix_nanoseconds(df['TimeStamp'])    # One C-level parse of the whole column instead of a per-row `.apply`
+    df['unix_ms'] = ns // 1_000_000
+    df['lsl_unix_ts'] = (ns // 1_000) / 1e6                 # Divide from exact int microseconds; int64 ns overflows float64 precision
+    df['_ts_ns'] = ns                                       # int64 dedup key; hashing ints is far cheaper than timestamp strings
     df = df.rename(columns=_MUSE_REMAPPINGS).sort_values('unix_ms')
     
-    # Separate blinks and signals
-    blinks = df[df['Elements'] == '/muse/elements/blink']    
-    signals = df[df['Elements'].isna()]
-    # Identify components
-    eeg_raw = signals[_EEG_COLUMNS_TS]
-    eeg_groups = eeg_raw.groupby('TimeStamp', as_index=False)
-    eeg = eeg_groups.last() if groupby_choice == 'last' else eeg_groups.first()
-    accel_raw = signals[_ACCEL_COLUMNS_TS]
-    accel_groups = accel_raw.groupby('TimeStamp', as_index=False)
-    accel = accel_groups.last() if groupby_choice == 'last' else accel_groups.first()
-    gyro_raw = signals[_GYRO_COLUMNS_TS]
-    gyro_groups = gyro_raw.groupby('TimeStamp', as_index=False)
-    gyro = gyro_groups.last() if groupby_choice == 'last' else gyro_groups.first()
+    # Separate blinks and signals. `Elements` is categorical, so we compare
+    # against the category code (int8) rather than the string itself.
+    elements = df['Elements']
+    try:
+        blink_code = elements.cat.categories.get_loc('/muse/elements/blink')
+        blink_mask = (elements.cat.codes == blink_code).to_numpy()
+    except KeyError:
+        blink_mask = np.zeros(len(df), dtype=bool)
+    blinks = df[blink_mask].drop(columns='_ts_ns')
+    signals = df[elements.isna().to_numpy()]
+    # Identify components. The rows are already sorted by timestamp, so
+    # "keep last/first per timestamp" is a plain drop_duplicates pass rather
+    # than the much heavier groupby + aggregate.
+    keep = 'last' if groupby_choice == 'last' else 'first'
+    eeg = signals[_EEG_COLUMNS_TS + ['_ts_ns']].drop_duplicates(subset='_ts_ns', keep=keep).drop(columns='_ts_ns')
+    accel = signals[_ACCEL_COLUMNS_TS + ['_ts_ns']].drop_duplicates(subset='_ts_ns', keep=keep).drop(columns='_ts_ns')
+    gyro = signals[_GYRO_COLUMNS_TS + ['_ts_ns']].drop_duplicates(subset='_ts_ns', keep=keep).drop(columns='_ts_ns')
     # Rename colnames in accel and gyro dataframes
     accel = accel.rename(columns={'accel_x':'X','accel_y':'Y','accel_z':'Z'})
     gyro = gyro.rename(columns={'gyro_x':'X','gyro_y':'Y','gyro_z':'Z'})
@@ -160,13 +196,13 @@ def mm_to_bluemuse(target_filepath:str, output_dir:str="converted", groupby_choi
     output_dir = os.path.join(os.path.dirname(target_filepath),output_dir)
     os.makedirs(output_dir, exist_ok=True)
     eeg_outpath = os.path.join(output_dir, 'EEG.csv')
-    eeg.to_csv(eeg_outpath, index=False)
+    write_csv(eeg, eeg_outpath)
     accel_outpath = os.path.join(output_dir, 'Accelerometer.csv')
-    accel.to_csv(accel_outpath, index=False)
+    write_csv(accel, accel_outpath)
     gyro_outpath = os.path.join(output_dir, 'Gyroscope.csv')
-    gyro.to_csv(gyro_outpath, index=False)
+    write_csv(gyro, gyro_outpath)
     blinks_outpath = os.path.join(output_dir, 'BLINKS.csv')
-    blinks.to_csv(blinks_outpath, index=False)
+    write_csv(blinks, blinks_outpath)
     return output_dir, eeg_outpath, accel_outpath, gyro_outpath, blinks_outpath
 
 
@@ -6,68 +6,192 @@ import argparse
 import matplotlib.pyplot as plt
 from scipy.signal import welch
 
+# Optional: numba-compiled validation kernel, when installed
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Optional: pandas' multithreaded pyarrow CSV engine, when installed
+# (chunked reads stay on the C parser — pyarrow does not support chunksize)
+try:
+    import pyarrow  # noqa: F401
+    _CSV_ENGINE = {'engine': 'pyarrow'}
+except ImportError:
+    _CSV_ENGINE = {}
+
 TIMESTAMP_COLUMNS = ['TimeStamp', 'unix_ms', 'unix_ts', 'lsl_unix_ts']
 
+def read_table(src:str):
+    # Binary recordings from record.py -f feather load without any string
+    # parsing; everything else goes through the CSV reader.
+    if str(src).endswith('.feather'):
+        return pd.read_feather(src)
+    return pd.read_csv(src, **_CSV_ENGINE)
+
 # ============ VALIDATION FUNCTIONS ============
 
+_TICKS = "▁▂▃▄▅▆▇█"
+
 def sparkline(values):
-    ticks = "▁▂▃▄▅▆▇█"
+    ticks = _TICKS
     values = np.asarray(values, dtype=float)
     if values.max() == 0:
         return ""
     scaled = (values - values.min()) / (values.max() - values.min())
     return "".join(ticks[int(v * (len(ticks) - 1))] for v in scaled)
 
+if njit is not None:
+    @njit(cache=True)
+    def _hist_ticks(values, bins, lo, hi):
+        # Fused histogram + tick scaling: one pass over the samples, no
+        # intermediate ndarrays. Returns -1 ticks when the range is empty.
+        out = np.full(bins, -1, dtype=np.int8)
+        width = hi - lo
+        # NaN-safe: `not (width > 0.0)` also rejects a NaN range, which
+        # would otherwise make int(nan) an out-of-bounds bin index
+        if not (width > 0.0):
+            return out
+        scale = bins / width
+        counts = np.zeros(bins, dtype=np.int64)
+        for i in range(values.shape[0]):
+            v = values[i]
+            if v != v or v < lo or v > hi:
+                continue
+            b = int((v - lo) * scale)
+            if b >= bins:
+                b = bins - 1
+            counts[b] += 1
+        cmin, cmax = counts.min(), counts.max()
+        if cmax == 0 or cmax == cmin:
+            return out
+        for b in range(bins):
+            out[b] = np.int8((counts[b] - cmin) * 7 // (cmax - cmin))
+        return out
+else:
+    _hist_ticks = None
+
+# Samples below this count aren't worth dispatching to the compiled kernel
+_HIST_JIT_THRESHOLD = 10_000
+
 def histogram_sparkline(values, bins=40, range=None):
     values = np.asarray(values, dtype=float)
+    if _hist_ticks is not None and values.size >= _HIST_JIT_THRESHOLD:
+        lo, hi = range if range is not None else (values.min(), values.max())
+        # All-NaN columns (e.g. a flat channel normalized by std=NaN) give
+        # a NaN range — leave those to the numpy path's clean ValueError
+        if not (np.isnan(lo) or np.isnan(hi)):
+            ticks = _hist_ticks(values, bins, float(lo), float(hi))
+            if ticks[0] >= 0:
+                return "".join(_TICKS[t] for t in ticks)
+            return ""
     hist, _ = np.histogram(values, bins=bins, range=range)
     return sparkline(hist)
 
 # ============ MAIN ============
 
-def normalize(rest_src:str, exp_src:str, ts_col:str='lsl_unix_ts', start_buffer=5.0, end_buffer=5.0, validate:bool=False):
+def normalize(rest_src:str, exp_src:str, ts_col:str='lsl_unix_ts', start_buffer=5.0, end_buffer=5.0, validate:bool=False, chunksize:int=None):
 
-    # Load data
-    rest_df = pd.read_csv(rest_src)
-    exp_df  = pd.read_csv(exp_src)
+    # Load the rest data (the experimental file is loaded below — in full, or
+    # streamed in chunks when a chunksize is given)
+    rest_df = read_table(rest_src)
 
     # Identify EEG channel columns
     channel_cols = [c for c in rest_df.columns if c not in TIMESTAMP_COLUMNS]
 
-    # Sanity check
-    missing = set(channel_cols) - set(exp_df.columns)
-    if missing:
-        raise ValueError(f"Experimental CSV missing channels: {missing}")
-
-    # Cull rest EEG edges
-    t_start = rest_df[ts_col].min() + start_buffer
-    t_end   = rest_df[ts_col].max() - end_buffer
+    # Cull rest EEG edges. Recordings are time-ordered, so the cull is two
+    # binary searches on the timestamp column rather than a pair of full
+    # boolean scans; out-of-order files get sorted first.
+    ts = rest_df[ts_col].to_numpy()
+    if len(ts) == 0:
+        raise ValueError("Rest EEG empty after culling — check time column.")
+    if not np.all(ts[1:] >= ts[:-1]):
+        rest_df = rest_df.sort_values(ts_col, ignore_index=True)
+        ts = rest_df[ts_col].to_numpy()
+    t_start = ts[0] + start_buffer
+    t_end   = ts[-1] - end_buffer
 
-    rest_mid = rest_df[
-        (rest_df[ts_col] >= t_start) &
-        (rest_df[ts_col] <= t_end)
-    ]
+    lo = np.searchsorted(ts, t_start, side='left')
+    hi = np.searchsorted(ts, t_end, side='right')
+    rest_mid = rest_df.iloc[lo:hi]
 
     if len(rest_mid) == 0:
         raise ValueError("Rest EEG empty after culling — check time column.")
 
-    # Compute baseline statistics
-    baseline_mean = rest_mid[channel_cols].mean()
-    baseline_std  = rest_mid[channel_cols].std(ddof=0)
+    # Compute baseline statistics in one traversal: sum and einsum
+    # sum-of-squares read the rest window once, instead of separate mean()
+    # and std() reductions walking it twice. NaN samples are zeroed out and
+    # excluded from the per-channel counts — the same pattern as the
+    # chunked means pass in filter.py — matching pandas' NaN-skipping
+    # mean()/std(ddof=0).
+    x = rest_mid[channel_cols].to_numpy()
+    valid = ~np.isnan(x)
+    n = valid.sum(axis=0).astype(np.float64)
+    if not valid.all():
+        x = np.where(valid, x, 0.0)
+    s = x.sum(axis=0)
+    ss = np.einsum('ij,ij->j', x, x)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_arr = s / n
+        var = ss / n - mean_arr * mean_arr
+    baseline_mean = pd.Series(mean_arr, index=channel_cols)
+    baseline_std  = pd.Series(np.sqrt(np.maximum(var, 0.0)), index=channel_cols)
 
     # Prevent divide-by-zero
     baseline_std[baseline_std == 0] = np.nan
 
-    # Normalize experimental EEG
-    exp_norm = exp_df.copy()
-
-    exp_norm[channel_cols] = (
-        exp_df[channel_cols] - baseline_mean
-    ) / baseline_std
+    # ndarray views of the baseline, for broadcasting without pandas'
+    # column-alignment machinery
+    mean_arr = baseline_mean.to_numpy()
+    std_arr  = baseline_std.to_numpy()
 
-    # Save result
+    # Output location
     out_filename = ''.join(os.path.basename(exp_src).split('.')[:-1]) + '_normalized.csv'
     outpath = os.path.join(os.path.dirname(exp_src), out_filename)
+
+    # Streaming mode: normalize and append chunk-by-chunk, so the
+    # experimental file is never fully resident. Validation needs the full
+    # frames, so it is skipped in this mode.
+    if chunksize is not None:
+        if str(exp_src).endswith('.feather'):
+            raise ValueError("Chunked streaming supports CSV input only.")
+        first = True
+        for chunk in pd.read_csv(exp_src, chunksize=chunksize):
+            if first:
+                missing = set(channel_cols) - set(chunk.columns)
+                if missing:
+                    raise ValueError(f"Experimental CSV missing channels: {missing}")
+            arr = chunk[channel_cols].to_numpy(copy=True)
+            arr -= mean_arr
+            arr /= std_arr
+            chunk[channel_cols] = arr
+            chunk.to_csv(outpath, index=False, header=first, mode='w' if first else 'a')
+            first = False
+        print("Normalization complete.")
+        print(f"Used {len(rest_mid)} rest samples for baseline.")
+        if validate:
+            print("Skipping validation: not supported in chunked mode.")
+        return outpath
+
+    exp_df = read_table(exp_src)
+
+    # Sanity check
+    missing = set(channel_cols) - set(exp_df.columns)
+    if missing:
+        raise ValueError(f"Experimental CSV missing channels: {missing}")
+
+    # Normalize experimental EEG: two in-place broadcast kernels on a raw
+    # ndarray, instead of DataFrame arithmetic that allocates an aligned
+    # intermediate per operator. The shallow copy keeps exp_df's raw values
+    # intact for validation without duplicating the timestamp columns.
+    exp_norm = exp_df.copy(deep=False)
+
+    arr = exp_df[channel_cols].to_numpy(copy=True)
+    arr -= mean_arr
+    arr /= std_arr
+    exp_norm[channel_cols] = arr
+
+    # Save result
     exp_norm.to_csv(outpath, index=False)
 
     print("Normalization complete.")
@@ -120,6 +244,7 @@ if __name__ == "__main__":
     parser.add_argument('-sb', '--start_buffer', help='The time buffer to cull out from the beginning of the rest-state EEG', type=float, default=5.0)
     parser.add_argument('-eb', '--end_buffer', help='The time buffer to cull out from the end of the rest-state EEG', type=float, default=5.0)
     parser.add_argument('-v', '--validate', help="Should we validate if the normalization is correct?", action='store_true')
+    parser.add_argument('-cs', '--chunksize', help="Stream the experimental file in blocks of this many rows to cap memory usage (skips validation).", type=int, default=None)
     args = parser.parse_args()
-    normalize(args.rest_src, args.eeg_src, ts_col=args.ts_col, start_buffer=args.start_buffer, end_buffer=args.end_buffer, validate=args.validate)
+    normalize(args.rest_src, args.eeg_src, ts_col=args.ts_col, start_buffer=args.start_buffer, end_buffer=args.end_buffer, validate=args.validate, chunksize=args.chunksize)
 
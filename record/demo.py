@@ -1,7 +1,6 @@
 import time
 import signal
 from threading import Thread, Event, Lock
-from collections import deque
 
 import numpy as np
 from pylsl import StreamInlet, resolve_byprop
@@ -32,6 +31,55 @@ VIS_WINDOW_SEC = 5
 PLOT_FPS = 20
 
 
+# ===================== VIS BUFFER =====================
+
+class RingBuffer:
+    """Fixed-length sample buffer on a preallocated float32 array.
+
+    append() overwrites the oldest row once full; snapshot() returns the
+    samples in arrival order. Avoids the per-frame deque -> ndarray
+    conversion, which copied and type-dispatched every element at PLOT_FPS.
+    """
+
+    def __init__(self, maxlen, n_ch):
+        self.maxlen = maxlen
+        self.data = np.empty((maxlen, n_ch), dtype=np.float32)
+        self.idx = 0      # next write position
+        self.count = 0    # rows filled so far, saturates at maxlen
+
+    def append(self, sample):
+        self.data[self.idx] = sample
+        self.idx = (self.idx + 1) % self.maxlen
+        if self.count < self.maxlen:
+            self.count += 1
+
+    def extend(self, samples):
+        # Bulk write under a single lock acquisition (see producer_thread)
+        arr = np.asarray(samples, dtype=np.float32)
+        n = len(arr)
+        if n == 0:
+            return
+        if n >= self.maxlen:
+            self.data[:] = arr[-self.maxlen:]
+            self.idx = 0
+            self.count = self.maxlen
+            return
+        end = self.idx + n
+        if end <= self.maxlen:
+            self.data[self.idx:end] = arr
+        else:
+            split = self.maxlen - self.idx
+            self.data[self.idx:] = arr[:split]
+            self.data[:end - self.maxlen] = arr[split:]
+        self.idx = end % self.maxlen
+        self.count = min(self.count + n, self.maxlen)
+
+    def snapshot(self):
+        if self.count < self.maxlen:
+            return self.data[:self.count].copy()
+        return np.concatenate((self.data[self.idx:], self.data[:self.idx]))
+
+
 # ===================== GLOBALS =====================
 
 stop_event = Event()
@@ -41,7 +89,7 @@ viz_locks = {}
 
 for stype in STREAM_TYPES:
     maxlen = VIS_WINDOW_SEC * STREAM_RATES[stype]
-    viz_buffers[stype] = deque(maxlen=maxlen)
+    viz_buffers[stype] = RingBuffer(maxlen, len(STREAM_CHANNELS[stype]))
     viz_locks[stype] = Lock()
 
 
@@ -59,12 +107,14 @@ def producer_thread(stream_type):
     print(f"Visualizing {stream_type}")
 
     while not stop_event.is_set():
-        sample, _ = inlet.pull_sample(timeout=1.0)
-        if sample is None:
+        # Pull whole chunks: one C call covers up to 64 samples, and the
+        # viz buffer takes them under a single lock acquisition
+        samples, timestamps = inlet.pull_chunk(timeout=1.0, max_samples=64)
+        if not timestamps:
             continue
 
         with viz_locks[stream_type]:
-            viz_buffers[stream_type].append(sample)
+            viz_buffers[stream_type].extend(samples)
 
 
 # ===================== VISUALIZATION =====================
@@ -75,6 +125,9 @@ class StreamWindow(QtWidgets.QWidget):
         self.stream_type = stream_type
         self.channels = STREAM_CHANNELS[stream_type]
         self.n_ch = len(self.channels)
+        # Constant once the ring buffer is full — sliced per frame below,
+        # never reallocated
+        self._x_full = np.arange(VIS_WINDOW_SEC * STREAM_RATES[stream_type], dtype=np.int32)
 
         self.setWindowTitle(stream_type)
         self.resize(800, 400)
@@ -100,12 +153,12 @@ class StreamWindow(QtWidgets.QWidget):
 
     def update_plot(self):
         with viz_locks[self.stream_type]:
-            data = np.array(viz_buffers[self.stream_type])
+            data = viz_buffers[self.stream_type].snapshot()
 
         if data.size == 0:
             return
 
-        x = np.arange(len(data))
+        x = self._x_full[:len(data)]
         for ch in range(self.n_ch):
             self.curves[ch].setData(x, data[:, ch])
 
@@ -116,6 +169,7 @@ class EEGWindow(QtWidgets.QWidget):
 
         self.channels = STREAM_CHANNELS['EEG']
         self.n_ch = len(self.channels)
+        self._x_full = np.arange(VIS_WINDOW_SEC * STREAM_RATES['EEG'], dtype=np.int32)
 
         self.setWindowTitle("EEG")
         self.resize(900, 600)
@@ -137,6 +191,10 @@ class EEGWindow(QtWidgets.QWidget):
                 p.setXLink(self.plots[0])
 
             curve = p.plot(pen='c')
+            # A ~900 px plot can't usefully show all 1280 buffered samples;
+            # peak downsampling keeps extremes visible while cutting the
+            # per-frame vertex count pyqtgraph has to rasterize
+            curve.setDownsampling(auto=True, method='peak')
             self.plots.append(p)
             self.curves.append(curve)
 
@@ -146,12 +204,12 @@ class EEGWindow(QtWidgets.QWidget):
 
     def update_plot(self):
         with viz_locks['EEG']:
-            data = np.array(viz_buffers['EEG'])
+            data = viz_buffers['EEG'].snapshot()
 
         if data.size == 0:
             return
 
-        x = np.arange(len(data))
+        x = self._x_full[:len(data)]
         for ch in range(self.n_ch):
             self.curves[ch].setData(x, data[:, ch])
 
@@ -1,16 +1,22 @@
 import csv
 import time
 import os
+import tempfile
 import argparse
 from datetime import datetime
 import signal
 from queue import Queue, Empty
 from threading import Thread, Event, Lock
-from collections import deque
 
 import numpy as np
 from pylsl import StreamInlet, resolve_byprop
 
+# Optional: columnar binary output, when pyarrow is installed
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
 import pyqtgraph as pg
 from pyqtgraph.Qt import QtCore, QtWidgets
 
@@ -36,25 +42,90 @@ STREAM_RATES = {
 VIS_WINDOW_SEC = 5
 PLOT_FPS = 20
 
+# Rows buffered before each writerows flush — larger for the high-rate EEG
+# stream so every stream flushes a few times per second
+WRITE_BATCH = {
+    'EEG': 64,
+    'Accelerometer': 16,
+    'Gyroscope': 16,
+    'PPG': 16
+}
+
 # ===================== ARGUMENTS =====================
 
 parser = argparse.ArgumentParser(description="Record LSL streams of Muse devices. You can provide an output directory if needed.")
 parser.add_argument('-d', '--dir', help='[OPTIONAL] Provide an output directory where all files are to be saved.', type=str, default=None)
 parser.add_argument('-rd', '--record_duration', help="If toggled, you can define for how long the recording runs for, in seconds.", type=float)
 parser.add_argument('-v', '--visualize', help="Enable live visualization (PyQtGraph windows). Disabling visualizations may help with improving performance.", action="store_true")
+parser.add_argument('-f', '--format', help="Output file format. 'feather' writes columnar binary (needs pyarrow): no per-sample float-to-string conversion, smaller files, much faster downstream loads.", type=str, choices=['csv', 'feather'], default='csv')
 args = parser.parse_args()
 
+if args.format == 'feather' and pa is None:
+    print("WARNING: pyarrow is not installed — falling back to CSV output.")
+    args.format = 'csv'
+
+# ===================== VIS BUFFER =====================
+
+class RingBuffer:
+    """Fixed-length sample buffer on a preallocated float32 array.
+
+    append() overwrites the oldest row once full; snapshot() returns the
+    samples in arrival order. Avoids the per-frame deque -> ndarray
+    conversion, which copied and type-dispatched every element at PLOT_FPS.
+    """
+
+    def __init__(self, maxlen, n_ch):
+        self.maxlen = maxlen
+        self.data = np.empty((maxlen, n_ch), dtype=np.float32)
+        self.idx = 0      # next write position
+        self.count = 0    # rows filled so far, saturates at maxlen
+
+    def append(self, sample):
+        self.data[self.idx] = sample
+        self.idx = (self.idx + 1) % self.maxlen
+        if self.count < self.maxlen:
+            self.count += 1
+
+    def extend(self, samples):
+        # Bulk write under a single lock acquisition (see producer_thread)
+        arr = np.asarray(samples, dtype=np.float32)
+        n = len(arr)
+        if n == 0:
+            return
+        if n >= self.maxlen:
+            self.data[:] = arr[-self.maxlen:]
+            self.idx = 0
+            self.count = self.maxlen
+            return
+        end = self.idx + n
+        if end <= self.maxlen:
+            self.data[self.idx:end] = arr
+        else:
+            split = self.maxlen - self.idx
+            self.data[self.idx:] = arr[:split]
+            self.data[:end - self.maxlen] = arr[split:]
+        self.idx = end % self.maxlen
+        self.count = min(self.count + n, self.maxlen)
+
+    def snapshot(self):
+        if self.count < self.maxlen:
+            return self.data[:self.count].copy()
+        return np.concatenate((self.data[self.idx:], self.data[:self.idx]))
+
+
 # ===================== GLOBALS =====================
 
 stop_event = Event()
 
-base_outdir = args.dir if args.dir is not None else datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+# Microseconds in the default name make collisions effectively impossible,
+# so no O(n) existence scan over prior sessions. A user-supplied name that
+# already exists gets a unique suffix from mkdtemp in one shot.
+base_outdir = args.dir if args.dir is not None else datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
 outdir = "[recording]-" + base_outdir
-count = 0
-while os.path.exists(outdir):
-    count += 1
-    outdir = f"{base_outdir}_{count}"
-os.makedirs(outdir, exist_ok=True)
+if os.path.exists(outdir):
+    outdir = tempfile.mkdtemp(prefix=outdir + "_", dir=".")
+else:
+    os.makedirs(outdir)
 
 queues = {stype: Queue() for stype in STREAM_TYPES}
 
@@ -64,7 +135,7 @@ viz_locks = {}
 if args.visualize:
     for stype in STREAM_TYPES:
         maxlen = VIS_WINDOW_SEC * STREAM_RATES[stype]
-        viz_buffers[stype] = deque(maxlen=maxlen)
+        viz_buffers[stype] = RingBuffer(maxlen, len(STREAM_CHANNELS[stype]))
         viz_locks[stype] = Lock()
 
 
@@ -82,38 +153,109 @@ def producer_thread(stream_type):
     print(f"Streaming {stream_type}")
 
     while not stop_event.is_set():
-        sample, lsl_ts = inlet.pull_sample(timeout=1.0)
-        if sample is None:
+        # Pull whole chunks: one C call covers up to 64 samples, instead of
+        # a Python-level pull per sample at 256 Hz
+        samples, timestamps = inlet.pull_chunk(timeout=1.0, max_samples=64)
+        if not timestamps:
             continue
 
-        unix_ms = lsl_ts * 1000
-        row = [unix_ms, lsl_ts] + sample
-
-        queues[stream_type].put(row)
-
-        # Non-blocking visualization tap
+        # Structure-of-arrays hand-off: one ndarray per chunk on the queue
+        # instead of one Python list per sample, so queue traffic and
+        # allocations scale with chunks, not samples
+        ts = np.asarray(timestamps, dtype=np.float64)
+        batch = np.empty((len(ts), 2 + len(STREAM_CHANNELS[stream_type])), dtype=np.float64)
+        batch[:, 0] = ts * 1000
+        batch[:, 1] = ts
+        batch[:, 2:] = samples
+        queues[stream_type].put(batch)
+
+        # Non-blocking visualization tap — one lock acquisition per chunk
         if args.visualize:
             with viz_locks[stream_type]:
-                viz_buffers[stream_type].append(sample)
+                viz_buffers[stream_type].extend(samples)
 
 
 # ===================== CONSUMER =====================
 
+def _consume_feather(stream_type):
+    filepath = os.path.join(outdir, f"{stream_type}.feather")
+    # Larger batches than the CSV path: a record batch has per-batch
+    # framing overhead, and 1024 EEG rows is still only 4 s of signal
+    batch_size = WRITE_BATCH.get(stream_type, 16) * 16
+    columns = ['unix_ms', 'lsl_unix_ts', *STREAM_CHANNELS[stream_type]]
+    schema = pa.schema([(name, pa.float64()) for name in columns])
+
+    pending = []
+    pending_rows = 0
+    with pa.ipc.new_file(filepath, schema) as writer:
+
+        def flush():
+            nonlocal pending_rows
+            arr = pending[0] if len(pending) == 1 else np.concatenate(pending)
+            writer.write_batch(pa.record_batch(
+                [arr[:, i] for i in range(arr.shape[1])], schema=schema))
+            pending.clear()
+            pending_rows = 0
+
+        while not stop_event.is_set() or not queues[stream_type].empty():
+            try:
+                chunk = queues[stream_type].get(timeout=0.5)
+                pending.append(chunk)
+                pending_rows += len(chunk)
+                queues[stream_type].task_done()
+                if pending_rows >= batch_size:
+                    flush()
+            except Empty:
+                if pending:
+                    flush()
+                continue
+
+        if pending:
+            flush()
+
+
 def consumer_thread(stream_type):
+    if args.format == 'feather':
+        _consume_feather(stream_type)
+        return
+
     filepath = os.path.join(outdir, f"{stream_type}.csv")
 
-    with open(filepath, 'w', newline='') as f:
+    batch_size = WRITE_BATCH.get(stream_type, 16)
+
+    # Batch rows into writerows calls: at 256 Hz, per-row writerow is
+    # thousands of Python-level calls a second. The large open() buffer
+    # keeps syscalls down between flushes.
+    with open(filepath, 'w', newline='', buffering=1 << 16) as f:
         writer = csv.writer(f)
         writer.writerow(['unix_ms', 'lsl_unix_ts', *STREAM_CHANNELS[stream_type]])
 
+        pending = []
+        pending_rows = 0
         while not stop_event.is_set() or not queues[stream_type].empty():
             try:
-                row = queues[stream_type].get(timeout=0.5)
-                writer.writerow(row)
+                chunk = queues[stream_type].get(timeout=0.5)
+                pending.append(chunk)
+                pending_rows += len(chunk)
                 queues[stream_type].task_done()
+                if pending_rows >= batch_size:
+                    for c in pending:
+                        writer.writerows(c.tolist())
+                    pending.clear()
+                    pending_rows = 0
             except Empty:
+                # Stream went quiet — flush what's pending so the file on
+                # disk stays current
+                for c in pending:
+                    writer.writerows(c.tolist())
+                pending.clear()
+                pending_rows = 0
                 continue
 
+        # Drain any tail rows on shutdown
+        for c in pending:
+            writer.writerows(c.tolist())
+
 
 # ===================== VISUALIZATION =====================
 
@@ -123,6 +265,9 @@ class StreamWindow(QtWidgets.QWidget):
         self.stream_type = stream_type
         self.channels = STREAM_CHANNELS[stream_type]
         self.n_ch = len(self.channels)
+        # Constant once the ring buffer is full — sliced per frame below,
+        # never reallocated
+        self._x_full = np.arange(VIS_WINDOW_SEC * STREAM_RATES[stream_type], dtype=np.int32)
 
         self.setWindowTitle(stream_type)
         self.resize(800, 400)
@@ -148,12 +293,12 @@ class StreamWindow(QtWidgets.QWidget):
 
     def update_plot(self):
         with viz_locks[self.stream_type]:
-            data = np.array(viz_buffers[self.stream_type])
+            data = viz_buffers[self.stream_type].snapshot()
 
         if data.size == 0:
             return
 
-        x = np.arange(len(data))
+        x = self._x_full[:len(data)]
 
         for ch in range(self.n_ch):
             self.curves[ch].setData(x, data[:, ch])
@@ -165,6 +310,7 @@ class EEGWindow(QtWidgets.QWidget):
         self.stream_type = 'EEG'
         self.channels = STREAM_CHANNELS['EEG']
         self.n_ch = len(self.channels)
+        self._x_full = np.arange(VIS_WINDOW_SEC * STREAM_RATES['EEG'], dtype=np.int32)
 
         self.setWindowTitle("EEG")
         self.resize(900, 600)
@@ -186,6 +332,10 @@ class EEGWindow(QtWidgets.QWidget):
                 p.setXLink(self.plots[0])
 
             curve = p.plot(pen='c')
+            # A ~900 px plot can't usefully show all 1280 buffered samples;
+            # peak downsampling keeps extremes visible while cutting the
+            # per-frame vertex count pyqtgraph has to rasterize
+            curve.setDownsampling(auto=True, method='peak')
             self.plots.append(p)
             self.curves.append(curve)
 
@@ -195,12 +345,12 @@ class EEGWindow(QtWidgets.QWidget):
 
     def update_plot(self):
         with viz_locks['EEG']:
-            data = np.array(viz_buffers['EEG'])
+            data = viz_buffers['EEG'].snapshot()
 
         if data.size == 0:
             return
 
-        x = np.arange(len(data))
+        x = self._x_full[:len(data)]
 
         for ch in range(self.n_ch):
             self.curves[ch].setData(x, data[:, ch])